@@ -1,9 +1,7 @@
 """Authentication support for the Hydrawise v2 GraphQL API."""
 
+import asyncio
 from datetime import datetime, timedelta
-from threading import Lock
-
-import aiohttp
 
 from .exceptions import NotAuthorizedError
 
@@ -20,13 +18,16 @@ class Auth:
         """Initializer."""
         self.__username = username
         self.__password = password
-        self._lock = Lock()
+        self._lock = asyncio.Lock()
         self._token: str | None = None
+        self._auth_header: str | None = None
         self._token_type: str | None = None
         self._token_expires: datetime | None = None
         self._refresh_token: str | None = None
 
     async def _fetch_token_locked(self, refresh=False):
+        import aiohttp
+
         data = {
             "client_id": CLIENT_ID,
             "client_secret": CLIENT_SECRET,
@@ -52,17 +53,19 @@ class Auth:
                     self._token_type = None
                     self._token = None
                     self._token_expires = None
+                    self._auth_header = None
                     raise NotAuthorizedError(resp_json["message"])
                 self._token = resp_json["access_token"]
                 self._refresh_token = resp_json["refresh_token"]
                 self._token_type = resp_json["token_type"]
+                self._auth_header = f"{self._token_type} {self._token}"
                 self._token_expires = datetime.now() + timedelta(
                     seconds=resp_json["expires_in"]
                 )
 
     async def check_token(self):
         """Checks a token and refreshes if necessary."""
-        with self._lock:
+        async with self._lock:
             if self._token is None:
                 await self._fetch_token_locked(refresh=False)
             elif self._token_expires - datetime.now() < timedelta(minutes=5):
@@ -74,5 +77,5 @@ class Auth:
         :rtype: string
         """
         await self.check_token()
-        with self._lock:
-            return f"{self._token_type} {self._token}"
+        async with self._lock:
+            return self._auth_header
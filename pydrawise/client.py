@@ -1,15 +1,14 @@
 """Client library for interacting with Hydrawise's cloud API."""
 
-import logging
+from __future__ import annotations
+
+import asyncio
 from datetime import datetime
 from functools import cache
-
-from apischema.graphql import graphql_schema
-from gql import Client
-from gql.dsl import DSLField, DSLMutation, DSLQuery, DSLSchema, DSLSelectable, dsl_gql
-from gql.transport.aiohttp import AIOHTTPTransport
-from gql.transport.aiohttp import log as gql_log
-from graphql import GraphQLSchema
+import logging
+import time
+from typing import TYPE_CHECKING
+from weakref import WeakValueDictionary
 
 from .auth import Auth
 from .exceptions import MutationError
@@ -17,71 +16,348 @@ from .schema import (
     Controller,
     DateTime,
     Mutation,
-    StatusCodeAndSummary,
     Query,
+    StatusCodeAndSummary,
     User,
     Zone,
     ZoneSuspension,
 )
 from .schema_utils import deserialize, get_selectors
 
+# gql, graphql and aiohttp are imported where they are first needed, which
+# keeps importing this package cheap.
+if TYPE_CHECKING:
+    from gql import Client
+    from gql.client import AsyncClientSession
+    from gql.dsl import DSLExecutable, DSLSchema, DSLVariableDefinitions
+    from graphql import DocumentNode, GraphQLSchema
+
 # GQL is quite chatty in logs by default.
-gql_log.setLevel(logging.ERROR)
+logging.getLogger("gql.transport.aiohttp").setLevel(logging.ERROR)
 
 API_URL = "https://app.hydrawise.com/api/v2/graph"
+DEFAULT_CACHE_TTL = 5.0
+KEEPALIVE_TIMEOUT = 75
 
 
 @cache
 def _get_schema() -> GraphQLSchema:
+    from apischema.graphql import graphql_schema
+
     return graphql_schema(
         query=[getattr(Query, m) for m in Query.__abstractmethods__],
         mutation=[getattr(Mutation, m) for m in Mutation.__abstractmethods__],
     )
 
 
+@cache
+def _get_dsl_schema() -> DSLSchema:
+    from gql.dsl import DSLSchema
+
+    return DSLSchema(_get_schema())
+
+
+def _compile(
+    op: DSLExecutable, var: DSLVariableDefinitions | None = None
+) -> DocumentNode:
+    """Compiles a DSL operation into a plain GraphQL document.
+
+    The operation is printed once and parsed back, so the cached document only
+    holds the query itself.
+    """
+    from gql import gql
+    from gql.dsl import dsl_gql
+    from graphql import print_ast
+
+    if var is not None:
+        op.variable_definitions = var
+    return gql(print_ast(dsl_gql(op)))
+
+
+@cache
+def _user_document() -> DocumentNode:
+    from gql.dsl import DSLQuery
+
+    ds = _get_dsl_schema()
+    return _compile(DSLQuery(ds.Query.me.select(*get_selectors(ds, User))))
+
+
+@cache
+def _controllers_document() -> DocumentNode:
+    from gql.dsl import DSLQuery
+
+    ds = _get_dsl_schema()
+    return _compile(
+        DSLQuery(
+            ds.Query.me.select(
+                ds.User.controllers.select(*get_selectors(ds, Controller)),
+            )
+        )
+    )
+
+
+@cache
+def _controllers_with_zones_document() -> DocumentNode:
+    from gql.dsl import DSLQuery
+
+    ds = _get_dsl_schema()
+    return _compile(
+        DSLQuery(
+            ds.Query.me.select(
+                ds.User.controllers.select(
+                    *get_selectors(ds, Controller),
+                    ds.Controller.zones.select(*get_selectors(ds, Zone)),
+                ),
+            )
+        )
+    )
+
+
+@cache
+def _controller_document() -> DocumentNode:
+    from gql.dsl import DSLQuery, DSLVariableDefinitions
+
+    ds = _get_dsl_schema()
+    var = DSLVariableDefinitions()
+    op = DSLQuery(
+        ds.Query.controller(controllerId=var.controllerId).select(
+            *get_selectors(ds, Controller),
+        )
+    )
+    return _compile(op, var)
+
+
+@cache
+def _zones_document() -> DocumentNode:
+    from gql.dsl import DSLQuery, DSLVariableDefinitions
+
+    ds = _get_dsl_schema()
+    var = DSLVariableDefinitions()
+    op = DSLQuery(
+        ds.Query.controller(controllerId=var.controllerId).select(
+            ds.Controller.zones.select(*get_selectors(ds, Zone)),
+        )
+    )
+    return _compile(op, var)
+
+
+@cache
+def _zone_document() -> DocumentNode:
+    from gql.dsl import DSLQuery, DSLVariableDefinitions
+
+    ds = _get_dsl_schema()
+    var = DSLVariableDefinitions()
+    op = DSLQuery(ds.Query.zone(zoneId=var.zoneId).select(*get_selectors(ds, Zone)))
+    return _compile(op, var)
+
+
+@cache
+def _mutation_document(name: str, *arg_names: str) -> DocumentNode:
+    """Builds a mutation document taking the given arguments as variables.
+
+    Documents are cached by argument names, so each distinct call shape is only
+    built once per process.
+    """
+    from gql.dsl import DSLMutation, DSLVariableDefinitions
+    from graphql import get_named_type, is_leaf_type
+
+    ds = _get_dsl_schema()
+    var = DSLVariableDefinitions()
+    selector = getattr(ds.Mutation, name).args(
+        **{arg: getattr(var, arg) for arg in arg_names}
+    )
+    if not is_leaf_type(get_named_type(selector.field.type)):
+        selector.select(*get_selectors(ds, StatusCodeAndSummary))
+    op = DSLMutation(selector)
+    return _compile(op, var)
+
+
+class _SharedClient:
+    """A connected gql Client shared by several Hydrawise instances.
+
+    The session is opened by the first user and closed when the last one
+    releases it. A closed client cannot be reopened (its transport's connector
+    is closed along with the session), so it is removed from the pool and
+    acquire() returns None from then on.
+    """
+
+    def __init__(
+        self, key: tuple[str, asyncio.AbstractEventLoop], client: Client
+    ) -> None:
+        self._key = key
+        self._client = client
+        self._lock = asyncio.Lock()
+        self._session: AsyncClientSession | None = None
+        self._users = 0
+        self._closed = False
+
+    async def acquire(self) -> AsyncClientSession | None:
+        async with self._lock:
+            if self._closed:
+                return None
+            if self._session is None:
+                self._session = await self._client.connect_async()
+            self._users += 1
+            return self._session
+
+    async def release(self) -> None:
+        async with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                self._closed = True
+                if _shared_clients.get(self._key) is self:
+                    del _shared_clients[self._key]
+                if self._session is not None:
+                    self._session = None
+                    await self._client.close_async()
+
+
+# Clients are shared by every Hydrawise instance on the same event loop so they
+# also share one connection pool. This is safe across users because the
+# Authorization header is sent with each request rather than stored on the
+# session, and the session keeps no cookies (see Hydrawise._client).
+_shared_clients: WeakValueDictionary[
+    tuple[str, asyncio.AbstractEventLoop], _SharedClient
+] = WeakValueDictionary()
+
+
 class Hydrawise:
     """Client library for interacting with Hydrawise sprinkler controllers.
 
     Should be instantiated with an Auth object that handles authentication and low-level transport.
     """
 
-    def __init__(self, auth: Auth) -> None:
+    def __init__(self, auth: Auth, cache_ttl: float = DEFAULT_CACHE_TTL) -> None:
         """Initializes the client.
 
         :param auth: Handles authentication and transport.
         :type auth: Auth
+        :param cache_ttl: How long (in seconds) query results are reused before
+            being fetched again. Any mutation clears the cache. Set to zero to
+            disable caching.
+        :type cache_ttl: float
         """
         self._auth = auth
-        self._schema = DSLSchema(_get_schema())
+        self._cache_ttl = cache_ttl
+        self._cache: dict[tuple, tuple[float, dict]] = {}
+        self._shared_client: _SharedClient | None = None
+        self._session: AsyncClientSession | None = None
+        self._connect_lock = asyncio.Lock()
+        self._token: str | None = None
+        self._extra_args: dict = {}
+
+    async def __aenter__(self) -> "Hydrawise":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
 
     async def _client(self) -> Client:
-        headers = {"Authorization": await self._auth.token()}
-        transport = AIOHTTPTransport(url=API_URL, headers=headers)
-        return Client(transport=transport, parse_results=True)
-
-    async def _query(self, selector: DSLSelectable) -> dict:
-        async with await self._client() as session:
-            return await session.execute(dsl_gql(DSLQuery(selector)))
-
-    async def _mutation(self, selector: DSLField) -> None:
-        async with await self._client() as session:
-            result = await session.execute(dsl_gql(DSLMutation(selector)))
-            resp = result[selector.name]
-            if isinstance(resp, dict):
-                if resp["status"] != "OK":
-                    raise MutationError(resp["summary"])
-                return
-            elif not resp:
-                # Assume bool response
-                raise MutationError
+        import aiohttp
+        from gql import Client
+        from gql.transport.aiohttp import AIOHTTPTransport
+
+        transport = AIOHTTPTransport(
+            url=API_URL,
+            client_session_args={
+                "connector": aiohttp.TCPConnector(keepalive_timeout=KEEPALIVE_TIMEOUT),
+                # The session is shared across users, so cookies set for one
+                # user must never be sent on another's requests.
+                "cookie_jar": aiohttp.DummyCookieJar(),
+            },
+        )
+        # Responses are converted to dataclasses by deserialize(), which handles
+        # the raw JSON scalars directly, so gql must not parse them first.
+        return Client(transport=transport, parse_results=False)
+
+    async def _connect(self) -> AsyncClientSession:
+        async with self._connect_lock:
+            # Another caller may have connected while we waited for the lock.
+            key = (API_URL, asyncio.get_running_loop())
+            while self._session is None:
+                shared = _shared_clients.get(key)
+                if shared is None:
+                    shared = _SharedClient(key, await self._client())
+                    shared = _shared_clients.setdefault(key, shared)
+                # None means the shared client was closed while we waited for
+                # it, so try again with a fresh one.
+                self._session = await shared.acquire()
+                self._shared_client = shared
+            return self._session
+
+    async def close(self) -> None:
+        """Closes the underlying connection to the Hydrawise API.
+
+        The connection is shared with other clients on the same event loop and
+        is only closed once all of them have been closed. It is re-established
+        on the next request.
+        """
+        async with self._connect_lock:
+            if self._shared_client is not None:
+                await self._shared_client.release()
+            self._shared_client = None
+            self._session = None
+
+    async def _execute(
+        self, document: DocumentNode, variable_values: dict | None = None
+    ) -> dict:
+        session = self._session
+        if session is None:
+            session = await self._connect()
+        # The token may be rotated at any time, so it is attached per request
+        # rather than baked into the long-lived session.
+        token = await self._auth.token()
+        if token != self._token:
+            self._token = token
+            self._extra_args = {"headers": {"Authorization": token}}
+        return await session.execute(
+            document,
+            variable_values=variable_values,
+            extra_args=self._extra_args,
+        )
+
+    async def _query(
+        self, document: DocumentNode, variable_values: dict | None = None
+    ) -> dict:
+        # Documents are cached for the life of the process, so their identity
+        # is a stable (and cheap) cache key.
+        key = (id(document), frozenset((variable_values or {}).items()))
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached is not None and now < cached[0]:
+            return cached[1]
+        result = await self._execute(document, variable_values)
+        if self._cache_ttl > 0:
+            # Drop expired entries so the cache doesn't grow without bound.
+            self._cache = {k: v for k, v in self._cache.items() if now < v[0]}
+            self._cache[key] = (now + self._cache_ttl, result)
+        return result
+
+    async def _mutation(self, document: DocumentNode, variable_values: dict):
+        result = await self._execute(document, variable_values)
+        self._cache.clear()
+        [resp] = result.values()
+        return resp
+
+    async def _mutation_status(
+        self, document: DocumentNode, variable_values: dict
+    ) -> None:
+        resp = await self._mutation(document, variable_values)
+        if resp["status"] != "OK":
+            raise MutationError(resp["summary"])
+
+    async def _mutation_bool(
+        self, document: DocumentNode, variable_values: dict
+    ) -> None:
+        if not await self._mutation(document, variable_values):
+            raise MutationError
 
     async def get_user(self) -> User:
         """Retrieves the currently authenticated user.
 
         :rtype: User
         """
-        selector = self._schema.Query.me.select(*get_selectors(self._schema, User))
-        result = await self._query(selector)
+        result = await self._query(_user_document())
         return deserialize(User, result["me"])
 
     async def get_controllers(self) -> list[Controller]:
@@ -89,14 +365,39 @@ class Hydrawise:
 
         :rtype: list[Controller]
         """
-        selector = self._schema.Query.me.select(
-            self._schema.User.controllers.select(
-                *get_selectors(self._schema, Controller)
-            ),
-        )
-        result = await self._query(selector)
+        result = await self._query(_controllers_document())
         return deserialize(list[Controller], result["me"]["controllers"])
 
+    async def get_controllers_with_zones(self) -> list[Controller]:
+        """Retrieves all controllers and their zones in a single request.
+
+        :rtype: list[Controller]
+        """
+        result = await self._query(_controllers_with_zones_document())
+        controllers = []
+        for controller_json in result["me"]["controllers"]:
+            # Results may be cached, so leave the response untouched.
+            controller = deserialize(
+                Controller,
+                {k: v for k, v in controller_json.items() if k != "zones"},
+            )
+            controller.zones = deserialize(list[Zone], controller_json["zones"])
+            controllers.append(controller)
+        return controllers
+
+    async def snapshot(self) -> User:
+        """Retrieves the current user along with all of their controllers and zones.
+
+        The user and controllers are fetched concurrently.
+
+        :rtype: User
+        """
+        user, controllers = await asyncio.gather(
+            self.get_user(), self.get_controllers_with_zones()
+        )
+        user.controllers = controllers
+        return user
+
     async def get_controller(self, controller_id: int) -> Controller:
         """Retrieves a single controller by its unique identifier.
 
@@ -104,10 +405,9 @@ class Hydrawise:
         :type controller_id: int
         :rtype: Controller
         """
-        selector = self._schema.Query.controller(controllerId=controller_id).select(
-            *get_selectors(self._schema, Controller),
+        result = await self._query(
+            _controller_document(), {"controllerId": controller_id}
         )
-        result = await self._query(selector)
         return deserialize(Controller, result["controller"])
 
     async def get_zones(self, controller: Controller) -> list[Zone]:
@@ -117,10 +417,7 @@ class Hydrawise:
         :type controller: Controller
         :rtype: list[Zone]
         """
-        selector = self._schema.Query.controller(controllerId=controller.id).select(
-            self._schema.Controller.zones.select(*get_selectors(self._schema, Zone)),
-        )
-        result = await self._query(selector)
+        result = await self._query(_zones_document(), {"controllerId": controller.id})
         return deserialize(list[Zone], result["controller"]["zones"])
 
     async def get_zone(self, zone_id: int) -> Zone:
@@ -130,10 +427,7 @@ class Hydrawise:
         :type zone_id: int
         :rtype: Zone
         """
-        selector = self._schema.Query.zone(zoneId=zone_id).select(
-            *get_selectors(self._schema, Zone)
-        )
-        result = await self._query(selector)
+        result = await self._query(_zone_document(), {"zoneId": zone_id})
         return deserialize(Zone, result["zone"])
 
     async def start_zone(
@@ -152,17 +446,22 @@ class Hydrawise:
             specified (or zero), will run for its default configured time.
         :type custom_run_duration: int
         """
-        kwargs = {
-            "zoneId": zone.id,
-            "markRunAsScheduled": mark_run_as_scheduled,
-        }
+        # Variables not declared by the document are ignored, so the same
+        # values can be passed to either one.
         if custom_run_duration > 0:
-            kwargs["customRunDuration"] = custom_run_duration
-
-        selector = self._schema.Mutation.startZone.args(**kwargs).select(
-            *get_selectors(self._schema, StatusCodeAndSummary),
+            document = _mutation_document(
+                "startZone", "zoneId", "markRunAsScheduled", "customRunDuration"
+            )
+        else:
+            document = _mutation_document("startZone", "zoneId", "markRunAsScheduled")
+        await self._mutation_status(
+            document,
+            {
+                "zoneId": zone.id,
+                "markRunAsScheduled": mark_run_as_scheduled,
+                "customRunDuration": custom_run_duration,
+            },
         )
-        await self._mutation(selector)
 
     async def stop_zone(self, zone: Zone):
         """Stops a zone.
@@ -170,10 +469,9 @@ class Hydrawise:
         :param zone: The zone to stop.
         :type zone: Zone
         """
-        selector = self._schema.Mutation.stopZone.args(zoneId=zone.id).select(
-            *get_selectors(self._schema, StatusCodeAndSummary),
-        )
-        await self._mutation(selector)
+        variables = {"zoneId": zone.id}
+        document = _mutation_document("stopZone", *variables)
+        await self._mutation_status(document, variables)
 
     async def start_all_zones(
         self,
@@ -191,17 +489,27 @@ class Hydrawise:
             specified (or zero), will run for each zone's default configured time.
         :type custom_run_duration: int
         """
-        kwargs = {
-            "controllerId": controller.id,
-            "markRunAsScheduled": mark_run_as_scheduled,
-        }
+        # Variables not declared by the document are ignored, so the same
+        # values can be passed to either one.
         if custom_run_duration > 0:
-            kwargs["customRunDuration"] = custom_run_duration
-
-        selector = self._schema.Mutation.startAllZones.args(**kwargs).select(
-            *get_selectors(self._schema, StatusCodeAndSummary),
+            document = _mutation_document(
+                "startAllZones",
+                "controllerId",
+                "markRunAsScheduled",
+                "customRunDuration",
+            )
+        else:
+            document = _mutation_document(
+                "startAllZones", "controllerId", "markRunAsScheduled"
+            )
+        await self._mutation_status(
+            document,
+            {
+                "controllerId": controller.id,
+                "markRunAsScheduled": mark_run_as_scheduled,
+                "customRunDuration": custom_run_duration,
+            },
         )
-        await self._mutation(selector)
 
     async def stop_all_zones(self, controller: Controller):
         """Stops all zones attached to a controller.
@@ -209,12 +517,9 @@ class Hydrawise:
         :param controller: The controller whose zones to stop.
         :type controller: Controller
         """
-        selector = self._schema.Mutation.stopAllZones.args(
-            controllerId=controller.id
-        ).select(
-            *get_selectors(self._schema, StatusCodeAndSummary),
-        )
-        await self._mutation(selector)
+        variables = {"controllerId": controller.id}
+        document = _mutation_document("stopAllZones", *variables)
+        await self._mutation_status(document, variables)
 
     async def suspend_zone(self, zone: Zone, until: datetime):
         """Suspends a zone's schedule.
@@ -224,13 +529,12 @@ class Hydrawise:
         :param until: When the suspension should end.
         :type until: datetime
         """
-        selector = self._schema.Mutation.suspendZone.args(
-            zoneId=zone.id,
-            until=DateTime.to_json(until).value,
-        ).select(
-            *get_selectors(self._schema, StatusCodeAndSummary),
-        )
-        await self._mutation(selector)
+        variables = {
+            "zoneId": zone.id,
+            "until": DateTime.format(until),
+        }
+        document = _mutation_document("suspendZone", *variables)
+        await self._mutation_status(document, variables)
 
     async def resume_zone(self, zone: Zone):
         """Resumes a zone's schedule.
@@ -238,10 +542,9 @@ class Hydrawise:
         :param zone: The zone whose schedule to resume.
         :type zone: Zone
         """
-        selector = self._schema.Mutation.resumeZone.args(zoneId=zone.id).select(
-            *get_selectors(self._schema, StatusCodeAndSummary),
-        )
-        await self._mutation(selector)
+        variables = {"zoneId": zone.id}
+        document = _mutation_document("resumeZone", *variables)
+        await self._mutation_status(document, variables)
 
     async def suspend_all_zones(self, controller: Controller, until: datetime):
         """Suspends the schedule of all zones attached to a given controller.
@@ -251,13 +554,12 @@ class Hydrawise:
         :param until: When the suspension should end.
         :type until: datetime
         """
-        selector = self._schema.Mutation.suspendAllZones.args(
-            controllerId=controller.id,
-            until=DateTime.to_json(until).value,
-        ).select(
-            *get_selectors(self._schema, StatusCodeAndSummary),
-        )
-        await self._mutation(selector)
+        variables = {
+            "controllerId": controller.id,
+            "until": DateTime.format(until),
+        }
+        document = _mutation_document("suspendAllZones", *variables)
+        await self._mutation_status(document, variables)
 
     async def resume_all_zones(self, controller: Controller):
         """Resumes the schedule of all zones attached to the given controller.
@@ -265,12 +567,9 @@ class Hydrawise:
         :param controller: The controller whose zones to resume.
         :type controller: Controller
         """
-        selector = self._schema.Mutation.resumeAllZones.args(
-            controllerId=controller.id
-        ).select(
-            *get_selectors(self._schema, StatusCodeAndSummary),
-        )
-        await self._mutation(selector)
+        variables = {"controllerId": controller.id}
+        document = _mutation_document("resumeAllZones", *variables)
+        await self._mutation_status(document, variables)
 
     async def delete_zone_suspension(self, suspension: ZoneSuspension):
         """Removes a specific zone suspension.
@@ -280,7 +579,6 @@ class Hydrawise:
         :param suspension: The suspension to delete.
         :type suspension: ZoneSuspension
         """
-        selector = self._schema.Mutation.deleteZoneSuspension.args(
-            id=suspension.id
-        ).select()
-        await self._mutation(selector)
+        variables = {"id": suspension.id}
+        document = _mutation_document("deleteZoneSuspension", *variables)
+        await self._mutation_bool(document, variables)
@@ -4,7 +4,7 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 from enum import Enum, auto
 from typing import Optional, Union
 
@@ -63,17 +63,18 @@ class DateTime:
         """Converts a DateTime to a native python type."""
         return datetime.fromtimestamp(dt.timestamp)
 
+    @staticmethod
+    def format(dt: datetime) -> str:
+        """Formats a native datetime as a DateTime GraphQL string value."""
+        if dt.tzinfo is None:
+            # Make sure we have a timezone set so strftime outputs a valid string.
+            dt = dt.astimezone()
+        return dt.strftime("%a, %d %b %y %H:%I:%S %z")
+
     @staticmethod
     def to_json(dt: datetime) -> DateTime:
         """Converts a native datetime to a DateTime GraphQL type."""
-        local = dt
-        if local.tzinfo is None:
-            # Make sure we have a timezone set so strftime outputs a valid string.
-            local = local.replace(tzinfo=datetime.now(timezone.utc).astimezone().tzinfo)
-        return DateTime(
-            value=local.strftime("%a, %d %b %y %H:%I:%S %z"),
-            timestamp=int(dt.timestamp()),
-        )
+        return DateTime(value=DateTime.format(dt), timestamp=int(dt.timestamp()))
 
     @staticmethod
     def conversion() -> conversion:
@@ -4,24 +4,48 @@ from __future__ import annotations
 
 from collections import namedtuple
 from dataclasses import fields, is_dataclass
-from typing import Iterator, List, Type, Union, get_args, get_origin, get_type_hints
-
-from apischema import deserialize as _deserialize
+from functools import cache
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterator,
+    List,
+    Type,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+from apischema import deserialization_method, deserialize as _deserialize
 from apischema.metadata.keys import CONVERSION_METADATA, SKIP_METADATA
 from apischema.utils import to_camel_case
-from gql.dsl import DSLField, DSLInlineFragment, DSLSchema
+
+if TYPE_CHECKING:
+    from gql.dsl import DSLField, DSLSchema
 
 # For compatibility with < python 3.10.
 NoneType = type(None)
 
 
-def deserialize(*args, **kwargs):
+@cache
+def _deserialization_method(cls: Type) -> Callable[[Any], Any]:
+    # Responses may be cached and deserialized more than once, so the results
+    # must not share (mutable) containers with the response.
+    return deserialization_method(cls, aliaser=to_camel_case, no_copy=False)
+
+
+def deserialize(cls: Type, data: Any, **kwargs):
     """Deserializes a GraphQL JSON blob.
 
     :meta private:
     """
+    if not kwargs:
+        # Fast path: reuse the deserializer compiled for this type.
+        return _deserialization_method(cls)(data)
     kwargs.setdefault("aliaser", to_camel_case)
-    return _deserialize(*args, **kwargs)
+    return _deserialize(cls, data, **kwargs)
 
 
 _Field = namedtuple("_Field", ["name", "types"])
@@ -62,11 +86,16 @@ def _fields(cls) -> Iterator[_Field]:
         yield _Field(f.name, [field_type])
 
 
-def get_selectors(ds: DSLSchema, cls: Type) -> list[DSLField]:
+@cache
+def get_selectors(ds: DSLSchema, cls: Type) -> tuple[DSLField, ...]:
     """Constructs GraphQL selectors for the given dataclass.
 
+    Selectors only depend on the schema and the dataclass, so they are cached.
+
     :meta private:
     """
+    from gql.dsl import DSLInlineFragment
+
     ret = []
     for f in _fields(cls):
         dsl_field = getattr(getattr(ds, cls.__name__), f.name)
@@ -88,4 +117,4 @@ def get_selectors(ds: DSLSchema, cls: Type) -> list[DSLField]:
                     .select(*get_selectors(ds, f_type))
                 )
             ret.append(getattr(dsl_field, "select")(*sel_args))
-    return ret
+    return tuple(ret)
@@ -1,13 +1,19 @@
+import asyncio
 from datetime import datetime, timedelta
 from unittest.mock import create_autospec, patch
 
+import aiohttp
+from aioresponses import aioresponses
+from freezegun import freeze_time
 from gql import Client
 from gql.client import AsyncClientSession
 from graphql import print_ast
-from pytest import fixture
+from pytest import fixture, raises
 
+from pydrawise import auth
 from pydrawise.auth import Auth
 from pydrawise.client import Hydrawise
+from pydrawise.exceptions import MutationError
 from pydrawise.schema import Controller, Zone, ZoneSuspension
 from pydrawise.schema_utils import deserialize
 
@@ -27,7 +33,7 @@ def mock_session():
 @fixture
 def mock_client(mock_session):
     client = create_autospec(Client, spec_set=True, instance=True)
-    client.__aenter__.return_value = mock_session
+    client.connect_async.return_value = mock_session
     yield client
 
 
@@ -38,6 +44,29 @@ def api(mock_auth, mock_client):
         yield api
 
 
+@fixture
+def mock_token_fetch():
+    with aioresponses() as m:
+        m.post(
+            auth.TOKEN_URL,
+            status=200,
+            payload={
+                "access_token": "__access-token__",
+                "refresh_token": "__refresh-token__",
+                "token_type": "bearer",
+                "expires_in": 3600,
+            },
+        )
+        yield m
+
+
+@fixture
+def real_auth_api(mock_token_fetch, mock_client):
+    api = Hydrawise(Auth("__username__", "__password__"))
+    with patch.object(api, "_client", return_value=mock_client):
+        yield api
+
+
 @fixture
 def controller_json():
     yield {
@@ -132,14 +161,80 @@ async def test_get_controllers(api: Hydrawise, mock_session, controller_json):
     assert controller.status.actual_water_time.value == timedelta(minutes=10)
 
 
+async def test_get_controllers_with_zones(
+    api: Hydrawise, mock_session, controller_json, zone_json
+):
+    controller_json["zones"] = [zone_json]
+    mock_session.execute.return_value = {"me": {"controllers": [controller_json]}}
+    [controller] = await api.get_controllers_with_zones()
+    mock_session.execute.assert_awaited_once()
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    assert "controllers {" in query
+    assert "zones {" in query
+    assert controller.id == 9876
+    [zone] = controller.zones
+    assert zone.id == 1
+    assert zone.name == "Zone A"
+
+
+async def test_snapshot(api: Hydrawise, mock_session, controller_json, zone_json):
+    controller_json["zones"] = [zone_json]
+    user_json = {"id": 1234, "name": "My Name", "email": "me@asdf.com"}
+
+    async def execute(document, **kwargs):
+        query = print_ast(document)
+        if "zones {" in query:
+            return {"me": {"controllers": [controller_json]}}
+        return {"me": user_json}
+
+    mock_session.execute.side_effect = execute
+    user = await api.snapshot()
+    assert mock_session.execute.await_count == 2
+    assert user.id == 1234
+    [controller] = user.controllers
+    assert controller.id == 9876
+    [zone] = controller.zones
+    assert zone.id == 1
+
+
+async def test_snapshot_real_auth(
+    real_auth_api: Hydrawise,
+    mock_token_fetch,
+    mock_session,
+    controller_json,
+    zone_json,
+):
+    controller_json["zones"] = [zone_json]
+    user_json = {"id": 1234, "name": "My Name", "email": "me@asdf.com"}
+
+    async def execute(document, **kwargs):
+        query = print_ast(document)
+        if "zones {" in query:
+            return {"me": {"controllers": [controller_json]}}
+        return {"me": user_json}
+
+    mock_session.execute.side_effect = execute
+    # Both requests need a token on a cold start; only one may be fetched.
+    user = await asyncio.wait_for(real_auth_api.snapshot(), timeout=5)
+    assert user.id == 1234
+    [token_requests] = mock_token_fetch.requests.values()
+    assert len(token_requests) == 1
+    assert mock_session.execute.await_args.kwargs["extra_args"] == {
+        "headers": {"Authorization": "bearer __access-token__"}
+    }
+
+
 async def test_get_controller(api: Hydrawise, mock_session, controller_json):
     mock_session.execute.return_value = {"controller": controller_json}
     controller = await api.get_controller(9876)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "controller(" in query
-    assert "controllerId: 9876" in query
+    assert "controllerId: $controllerId" in query
+    assert variables["controllerId"] == 9876
 
     assert controller.last_contact_time == datetime(2023, 1, 1, 0, 0, 0)
     assert controller.last_action == datetime(2023, 1, 1, 0, 0, 0)
@@ -151,20 +246,24 @@ async def test_get_zones(api: Hydrawise, mock_session, controller_json, zone_jso
     ctrl = deserialize(Controller, controller_json)
     [zone] = await api.get_zones(ctrl)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "controller(" in query
-    assert "controllerId: 9876" in query
+    assert "controllerId: $controllerId" in query
+    assert variables["controllerId"] == 9876
 
 
 async def test_get_zone(api: Hydrawise, mock_session, zone_json):
     mock_session.execute.return_value = {"zone": zone_json}
     zone = await api.get_zone(1)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "zone(" in query
-    assert "zoneId: 1" in query
+    assert "zoneId: $zoneId" in query
+    assert variables["zoneId"] == 1
 
 
 async def test_start_zone(api: Hydrawise, mock_session, zone_json):
@@ -172,12 +271,27 @@ async def test_start_zone(api: Hydrawise, mock_session, zone_json):
     zone = deserialize(Zone, zone_json)
     await api.start_zone(zone, custom_run_duration=10)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
+    assert "startZone(" in query
+    assert "zoneId: $zoneId" in query
+    assert variables["zoneId"] == 1
+    assert "markRunAsScheduled: $markRunAsScheduled" in query
+    assert variables["markRunAsScheduled"] is False
+    assert "customRunDuration: $customRunDuration" in query
+    assert variables["customRunDuration"] == 10
+
+
+async def test_start_zone_default_duration(api: Hydrawise, mock_session, zone_json):
+    mock_session.execute.return_value = {"startZone": {"status": "OK"}}
+    zone = deserialize(Zone, zone_json)
+    await api.start_zone(zone)
+    mock_session.execute.assert_awaited_once()
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
     assert "startZone(" in query
-    assert "zoneId: 1" in query
-    assert "markRunAsScheduled: false" in query
-    assert "customRunDuration: 10" in query
+    assert "customRunDuration" not in query
 
 
 async def test_stop_zone(api: Hydrawise, mock_session, zone_json):
@@ -185,10 +299,12 @@ async def test_stop_zone(api: Hydrawise, mock_session, zone_json):
     zone = deserialize(Zone, zone_json)
     await api.stop_zone(zone)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "stopZone(" in query
-    assert "zoneId: 1" in query
+    assert "zoneId: $zoneId" in query
+    assert variables["zoneId"] == 1
 
 
 async def test_start_all_zones(api: Hydrawise, mock_session, controller_json):
@@ -196,12 +312,16 @@ async def test_start_all_zones(api: Hydrawise, mock_session, controller_json):
     ctrl = deserialize(Controller, controller_json)
     await api.start_all_zones(ctrl, custom_run_duration=10)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "startAllZones(" in query
-    assert "controllerId: 9876" in query
-    assert "markRunAsScheduled: false" in query
-    assert "customRunDuration: 10" in query
+    assert "controllerId: $controllerId" in query
+    assert variables["controllerId"] == 9876
+    assert "markRunAsScheduled: $markRunAsScheduled" in query
+    assert variables["markRunAsScheduled"] is False
+    assert "customRunDuration: $customRunDuration" in query
+    assert variables["customRunDuration"] == 10
 
 
 async def test_stop_all_zones(api: Hydrawise, mock_session, controller_json):
@@ -209,10 +329,12 @@ async def test_stop_all_zones(api: Hydrawise, mock_session, controller_json):
     ctrl = deserialize(Controller, controller_json)
     await api.stop_all_zones(ctrl)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "stopAllZones(" in query
-    assert "controllerId: 9876" in query
+    assert "controllerId: $controllerId" in query
+    assert variables["controllerId"] == 9876
 
 
 async def test_suspend_zone(api: Hydrawise, mock_session, zone_json):
@@ -220,11 +342,14 @@ async def test_suspend_zone(api: Hydrawise, mock_session, zone_json):
     zone = deserialize(Zone, zone_json)
     await api.suspend_zone(zone, until=datetime(2023, 1, 1, 0, 0, 0))
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "suspendZone(" in query
-    assert "zoneId: 1" in query
-    assert 'until: "Sun, 01 Jan 23 00:12:00 +0000"' in query
+    assert "zoneId: $zoneId" in query
+    assert variables["zoneId"] == 1
+    assert "until: $until" in query
+    assert variables["until"] == "Sun, 01 Jan 23 00:12:00 +0000"
 
 
 async def test_resume_zone(api: Hydrawise, mock_session, zone_json):
@@ -232,10 +357,12 @@ async def test_resume_zone(api: Hydrawise, mock_session, zone_json):
     zone = deserialize(Zone, zone_json)
     await api.resume_zone(zone)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "resumeZone(" in query
-    assert "zoneId: 1" in query
+    assert "zoneId: $zoneId" in query
+    assert variables["zoneId"] == 1
 
 
 async def test_suspend_all_zones(api: Hydrawise, mock_session, controller_json):
@@ -243,11 +370,15 @@ async def test_suspend_all_zones(api: Hydrawise, mock_session, controller_json):
     ctrl = deserialize(Controller, controller_json)
     await api.suspend_all_zones(ctrl, until=datetime(2023, 1, 1, 0, 0, 0))
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "suspendAllZones(" in query
-    assert "controllerId: 9876" in query
-    assert 'until: "Sun, 01 Jan 23 00:12:00 +0000"' in query
+    assert "suspendZone(" not in query
+    assert "controllerId: $controllerId" in query
+    assert variables["controllerId"] == 9876
+    assert "until: $until" in query
+    assert variables["until"] == "Sun, 01 Jan 23 00:12:00 +0000"
 
 
 async def test_resume_all_zones(api: Hydrawise, mock_session, controller_json):
@@ -255,10 +386,12 @@ async def test_resume_all_zones(api: Hydrawise, mock_session, controller_json):
     ctrl = deserialize(Controller, controller_json)
     await api.resume_all_zones(ctrl)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "resumeAllZones(" in query
-    assert "controllerId: 9876" in query
+    assert "controllerId: $controllerId" in query
+    assert variables["controllerId"] == 9876
 
 
 async def test_delete_zone_suspension(api: Hydrawise, mock_session):
@@ -270,7 +403,224 @@ async def test_delete_zone_suspension(api: Hydrawise, mock_session):
     )
     await api.delete_zone_suspension(suspension)
     mock_session.execute.assert_awaited_once()
-    [selector] = mock_session.execute.await_args.args
-    query = print_ast(selector)
+    [document] = mock_session.execute.await_args.args
+    query = print_ast(document)
+    variables = mock_session.execute.await_args.kwargs["variable_values"]
     assert "deleteZoneSuspension(" in query
-    assert "id: 2222" in query
+    assert "id: $id" in query
+    assert variables["id"] == 2222
+
+
+async def test_session_reused(api: Hydrawise, mock_client, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    await api.get_zone(1)
+    await api.get_zone(2)
+    mock_client.connect_async.assert_awaited_once()
+    assert mock_session.execute.await_count == 2
+    assert mock_session.execute.await_args.kwargs["extra_args"] == {
+        "headers": {"Authorization": "__token__"}
+    }
+
+    await api.close()
+    mock_client.close_async.assert_awaited_once()
+
+
+async def test_client_shared(mock_auth, mock_client, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    apis = [Hydrawise(mock_auth), Hydrawise(mock_auth)]
+    for api in apis:
+        with patch.object(api, "_client", return_value=mock_client):
+            await api.get_zone(1)
+    mock_client.connect_async.assert_awaited_once()
+
+    await apis[0].close()
+    mock_client.close_async.assert_not_awaited()
+    await apis[1].close()
+    mock_client.close_async.assert_awaited_once()
+
+
+async def test_client_reopened_after_close(
+    mock_auth, mock_client, mock_session, zone_json
+):
+    async def slow_close():
+        await asyncio.sleep(0)
+
+    mock_client.close_async.side_effect = slow_close
+    new_session = create_autospec(AsyncClientSession, spec_set=True, instance=True)
+    new_session.execute.return_value = {"zone": zone_json}
+    new_client = create_autospec(Client, spec_set=True, instance=True)
+    new_client.connect_async.return_value = new_session
+    mock_session.execute.return_value = {"zone": zone_json}
+
+    a = Hydrawise(mock_auth)
+    b = Hydrawise(mock_auth)
+    with (
+        patch.object(a, "_client", return_value=mock_client),
+        patch.object(b, "_client", return_value=new_client),
+    ):
+        await a.get_zone(1)
+        # b connects while a is closing the last reference to the shared client.
+        await asyncio.gather(a.close(), b.get_zone(1))
+        mock_client.close_async.assert_awaited_once()
+        mock_client.connect_async.assert_awaited_once()
+        new_client.connect_async.assert_awaited_once()
+        new_session.execute.assert_awaited_once()
+
+        # The closed client is never handed out again.
+        await a.get_zone(2)
+        mock_client.connect_async.assert_awaited_once()
+        assert a._shared_client is b._shared_client
+
+
+async def test_concurrent_connect(
+    real_auth_api: Hydrawise, mock_token_fetch, mock_client, mock_session
+):
+    async def slow_connect():
+        await asyncio.sleep(0)
+        return mock_session
+
+    mock_client.connect_async.side_effect = slow_connect
+    mock_session.execute.return_value = {
+        "me": {"id": 1234, "name": "My Name", "email": "me@asdf.com"}
+    }
+    # Both calls take the cold path: connecting and fetching a token.
+    await asyncio.wait_for(
+        asyncio.gather(real_auth_api.get_user(), real_auth_api.get_user()),
+        timeout=5,
+    )
+    mock_client.connect_async.assert_awaited_once()
+    assert mock_session.execute.await_count == 2
+    [token_requests] = mock_token_fetch.requests.values()
+    assert len(token_requests) == 1
+
+
+async def test_documents_cached(api: Hydrawise, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    await api.get_zone(1)
+    await api.get_zone(2)
+    [first, second] = mock_session.execute.await_args_list
+    assert first.args[0] is second.args[0]
+    assert first.kwargs["variable_values"] == {"zoneId": 1}
+    assert second.kwargs["variable_values"] == {"zoneId": 2}
+
+
+async def test_documents_shared(mock_auth, mock_client, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    for _ in range(2):
+        api = Hydrawise(mock_auth)
+        with patch.object(api, "_client", return_value=mock_client):
+            await api.get_zone(1)
+    [first, second] = mock_session.execute.await_args_list
+    assert first.args[0] is second.args[0]
+
+
+async def test_client_does_not_parse_results(mock_auth):
+    client = await Hydrawise(mock_auth)._client()
+    assert not client.parse_results
+
+
+async def test_client_does_not_keep_cookies(mock_auth):
+    client = await Hydrawise(mock_auth)._client()
+    cookie_jar = client.transport.client_session_args["cookie_jar"]
+    assert isinstance(cookie_jar, aiohttp.DummyCookieJar)
+
+
+async def test_token_rotation(api: Hydrawise, mock_auth, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    await api.get_zone(1)
+    await api.get_zone(2)
+    [first, second] = mock_session.execute.await_args_list
+    assert first.kwargs["extra_args"] is second.kwargs["extra_args"]
+
+    mock_auth.token.return_value = "__new_token__"
+    await api.get_zone(3)
+    assert mock_session.execute.await_args.kwargs["extra_args"] == {
+        "headers": {"Authorization": "__new_token__"}
+    }
+
+
+async def test_query_cache(api: Hydrawise, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    with freeze_time("2023-01-01 01:00:00") as t:
+        await api.get_zone(1)
+        await api.get_zone(1)
+        mock_session.execute.assert_awaited_once()
+
+        t.tick(delta=timedelta(seconds=10))
+        await api.get_zone(1)
+        assert mock_session.execute.await_count == 2
+
+
+async def test_query_cache_prunes_expired(api: Hydrawise, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    with freeze_time("2023-01-01 01:00:00") as t:
+        await api.get_zone(1)
+        await api.get_zone(2)
+        assert len(api._cache) == 2
+
+        t.tick(delta=timedelta(seconds=10))
+        await api.get_zone(3)
+        assert len(api._cache) == 1
+
+
+async def test_query_cache_disabled(mock_auth, mock_client, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    api = Hydrawise(mock_auth, cache_ttl=0)
+    with patch.object(api, "_client", return_value=mock_client):
+        await api.get_zone(1)
+        await api.get_zone(1)
+    assert mock_session.execute.await_count == 2
+    assert not api._cache
+
+
+async def test_query_cache_results_independent(api: Hydrawise, mock_session, zone_json):
+    zone_json["wateringSettings"] = {
+        "fixedWateringAdjustment": 0,
+        "cycleAndSoakSettings": None,
+        "standardProgramApplications": [
+            {
+                "zone": {"id": 1, "number": {"value": 1, "label": "One"}, "name": "A"},
+                "standardProgram": {"name": "Program", "startTimes": ["02:00"]},
+                "runTimeGroup": {"id": 1, "duration": 10},
+            }
+        ],
+    }
+    mock_session.execute.return_value = {"zone": zone_json}
+    first = await api.get_zone(1)
+    [app] = first.watering_settings.standard_program_applications
+    app.standard_program.start_times.append("04:00")
+
+    second = await api.get_zone(1)
+    mock_session.execute.assert_awaited_once()
+    [app] = second.watering_settings.standard_program_applications
+    assert app.standard_program.start_times == ["02:00"]
+
+
+async def test_mutation_clears_query_cache(api: Hydrawise, mock_session, zone_json):
+    mock_session.execute.return_value = {"zone": zone_json}
+    zone = await api.get_zone(1)
+    mock_session.execute.return_value = {"stopZone": {"status": "OK"}}
+    await api.stop_zone(zone)
+    mock_session.execute.return_value = {"zone": zone_json}
+    await api.get_zone(1)
+    assert mock_session.execute.await_count == 3
+
+
+async def test_mutation_error(api: Hydrawise, mock_session, zone_json):
+    mock_session.execute.return_value = {
+        "stopZone": {"status": "ERROR", "summary": "Zone is offline"}
+    }
+    zone = deserialize(Zone, zone_json)
+    with raises(MutationError, match="Zone is offline"):
+        await api.stop_zone(zone)
+
+
+async def test_delete_zone_suspension_error(api: Hydrawise, mock_session):
+    mock_session.execute.return_value = {"deleteZoneSuspension": False}
+    suspension = ZoneSuspension(
+        id=2222,
+        start_time=datetime(2023, 1, 1, 0, 0, 0),
+        end_time=datetime(2023, 1, 2, 0, 0, 0),
+    )
+    with raises(MutationError):
+        await api.delete_zone_suspension(suspension)
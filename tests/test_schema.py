@@ -1,5 +1,13 @@
+from datetime import datetime, timezone
+
 from pydrawise import schema
 
 
 def test_import_works():
     pass
+
+
+def test_date_time_format():
+    dt = datetime(2023, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
+    assert schema.DateTime.format(dt) == "Sun, 01 Jan 23 00:12:00 +0000"
+    assert schema.DateTime.to_json(dt).value == schema.DateTime.format(dt)